@@ -1,13 +1,23 @@
 import asyncio
+import functools
+import hashlib
 import logging
 import os
+import tempfile
+import threading
+import time
+from collections import deque
 
 import gradio as gr
 import pandas as pd
 import plotly.graph_objects as go
+import plotly.io as pio
 from dotenv import load_dotenv
 
-from finance_tracker.connectors.notion_to_pandas import get_finance_tracker_df
+from finance_tracker.connectors.notion_to_pandas import (
+    get_finance_tracker_df,
+    get_notion_cache_dir,
+)
 from finance_tracker.graphs.revenue_vs_expense_totals import (
     graph_business_revenue_vs_expense_and_tax_totals,
     graph_personal_revenue_vs_expense_and_saving_totals,
@@ -20,38 +30,184 @@ from finance_tracker.graphs.subcategory import (
     graph_personal_expenses_by_subcategory,
     graph_personal_revenue_by_subcategory,
 )
+from finance_tracker.graphs.utils import add_month_year_column
+
+load_dotenv()
+
+# Gradio serializes every displayed figure with Figure.to_json(), which is several times
+# faster with orjson than with the standard library json module
+pio.json.config.default_engine = "orjson"
 
 logging.basicConfig(level=logging.INFO)
 _logger = logging.getLogger(__name__)
 
+# How long (in seconds) a snapshot of the data on disk is used on startup instead of
+# fetching the data from Notion
+DATA_SNAPSHOT_MAX_AGE = int(os.getenv("DATA_SNAPSHOT_MAX_AGE", "3600"))
+
+# How many data exports are kept, so pages that still link to a recent export can
+# download it
+DATA_EXPORTS_TO_KEEP = 5
+
+
+def get_data_fingerprint(df: pd.DataFrame) -> str:
+    """Computes a fingerprint of the contents of a DataFrame.
+
+    Args:
+        df (pd.DataFrame): The DataFrame to fingerprint.
+
+    Returns:
+        str: A hex digest that changes whenever the contents of the DataFrame change.
+    """
+    row_hashes = pd.util.hash_pandas_object(df, index=False).to_numpy()
+    return hashlib.blake2b(row_hashes.tobytes(), digest_size=16).hexdigest()
+
 
 class DataCache:
     def __init__(self):
-        self.cached_df = None
+        # The cached DataFrame, the DataFrame with a 'month_year' column for the charts,
+        # and the fingerprint of the data. They are replaced together as one tuple, so
+        # concurrent readers never see them from different updates
+        self.data: tuple[pd.DataFrame, pd.DataFrame, str] | None = None
+        self.cached_figures = {}
+        self.export_paths = deque()
+        self._export_lock = threading.Lock()
+
+    def _set_data(self, df: pd.DataFrame) -> None:
+        """Replaces the cached DataFrame, dropping the cached figures only if the
+        contents of the data actually changed.
+        """
+        data_fingerprint = get_data_fingerprint(df)
+        # The 'month_year' column is added once for all charts, rather than by every chart
+        # for the rows it selects
+        chart_df = add_month_year_column(df)
+        previous_data = self.data
+        # The data is replaced before the figures, so a chart generated concurrently from
+        # the old data can only end up in the discarded figure cache
+        self.data = (df, chart_df, data_fingerprint)
+        if previous_data is None or data_fingerprint != previous_data[2]:
+            self.cached_figures = {}
+
+    @staticmethod
+    def _get_snapshot_path() -> str:
+        return os.path.join(get_notion_cache_dir(), "finance_tracker_df.json")
+
+    def _load_snapshot(self) -> pd.DataFrame | None:
+        """Loads the snapshot of the data on disk, if there is one that is not older than
+        `DATA_SNAPSHOT_MAX_AGE`.
+
+        Returns:
+        pd.DataFrame | None: The snapshot of the data, or None if there is no recent one
+            (or it cannot be read, in which case the data is fetched from Notion instead).
+        """
+        snapshot_path = self._get_snapshot_path()
+        if (
+            not os.path.exists(snapshot_path)
+            or time.time() - os.path.getmtime(snapshot_path) > DATA_SNAPSHOT_MAX_AGE
+        ):
+            return None
+        try:
+            return pd.read_json(snapshot_path, orient="table")
+        except (OSError, ValueError, KeyError) as e:
+            _logger.warning(
+                "Ignoring unreadable data snapshot %s: %s", snapshot_path, e
+            )
+            return None
+
+    def _save_snapshot(self, df: pd.DataFrame) -> None:
+        """Saves a snapshot of the data on disk, so it can be loaded instead of fetched
+        from Notion when the app restarts.
+
+        The snapshot is stored as JSON with a table schema (like the cached Notion pages,
+        rather than as a pickle), which keeps the dtypes of the columns, including the
+        categories of the categorical columns.
+        """
+        snapshot_path = self._get_snapshot_path()
+        os.makedirs(os.path.dirname(snapshot_path), exist_ok=True)
+        # Write to a temporary file first, so a partially written snapshot is never loaded.
+        # The file is unique per write, as data updates can run concurrently
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(snapshot_path), suffix=".tmp", delete=False
+        ) as f:
+            df.to_json(f, orient="table", index=False, double_precision=15)
+        os.replace(f.name, snapshot_path)
 
     def get_or_update_data(self) -> pd.DataFrame:
         """Fetches and returns the global cached DataFrame.
-        If the cached DataFrame is None, it updates the cache by fetching the data.
+        If the cached DataFrame is None, it is loaded from a recent snapshot on disk, or
+        otherwise fetched.
         Returns:
         pd.DataFrame: The cached or newly fetched DataFrame.
         """
-        if self.cached_df is None:
-            _logger.info("Data not loaded. Fetching data from Notion...")
-            self.cached_df = get_finance_tracker_df()
-            _logger.info("Data fetched and cached successfully.")
-        return self.cached_df
-
-    def update_cached_data(self) -> str:
+        if self.data is None:
+            df = self._load_snapshot()
+            if df is not None:
+                _logger.info("Data loaded from snapshot.")
+            else:
+                _logger.info("Data not loaded. Fetching data from Notion...")
+                df = get_finance_tracker_df()
+                self._save_snapshot(df)
+                _logger.info("Data fetched and cached successfully.")
+            self._set_data(df)
+        return self.data[0]
+
+    async def update_cached_data(self) -> str:
         """Forcibly updates the global cached DataFrame.
 
+        The fetch from Notion and the snapshot write run in a worker thread, so the event
+        loop keeps serving other requests (e.g. displaying charts) in the meantime.
+
         Returns:
         str: A message indicating that the data has been updated.
         """
         _logger.info("Forcing data update from Notion...")
-        self.cached_df = get_finance_tracker_df()
+        df = await asyncio.to_thread(get_finance_tracker_df, use_cache=False)
+        await asyncio.to_thread(self._save_snapshot, df)
+        self._set_data(df)
         _logger.info("Data updated successfully.")
         return "Data updated successfully."
 
+    def export_data(self) -> str:
+        """Writes the cached DataFrame to a CSV file for downloading.
+
+        The file is named after the data fingerprint, so it is only written again when
+        the contents of the data change. It is written under the system's temp directory,
+        which Gradio serves files from, and only the `DATA_EXPORTS_TO_KEEP` most recent
+        exports are kept.
+
+        Returns:
+        str: The path of the CSV file.
+        """
+        self.get_or_update_data()
+        # The data and its fingerprint are read together, so the export is never named
+        # after data from a different update
+        df, _, data_fingerprint = self.data
+        export_dir = os.path.join(tempfile.gettempdir(), "finance_tracker_exports")
+        export_path = os.path.join(
+            export_dir, f"finance_tracker_{data_fingerprint}.csv"
+        )
+        # Page loads and data updates can export concurrently
+        with self._export_lock:
+            if not os.path.exists(export_path):
+                _logger.info("Exporting data...")
+                os.makedirs(export_dir, exist_ok=True)
+                # Write to a temporary file first, so a partial export is never served
+                with tempfile.NamedTemporaryFile(
+                    dir=export_dir, suffix=".tmp", delete=False
+                ) as f:
+                    df.to_csv(f, index=False)
+                os.replace(f.name, export_path)
+            # A reused export is moved to the end, so it is not evicted as an old one
+            if export_path in self.export_paths:
+                self.export_paths.remove(export_path)
+            self.export_paths.append(export_path)
+            while len(self.export_paths) > DATA_EXPORTS_TO_KEEP:
+                try:
+                    os.remove(self.export_paths.popleft())
+                except FileNotFoundError:
+                    pass
+        return export_path
+
 
 data_cache = DataCache()
 
@@ -60,6 +216,9 @@ def generate_chart(chart_func) -> go.Figure:
     """Generates a chart using the provided function and returns a Plotly
     Figure object representing the chart.
 
+    Charts are cached per chart function until the contents of the data change, so
+    displaying the same chart again does not regenerate it.
+
     Args:
         chart_func (Callable[[pd.DataFrame], go.Figure]): The function to generate
             the chart.
@@ -67,62 +226,26 @@ def generate_chart(chart_func) -> go.Figure:
     Returns:
         go.Figure: A Plotly Figure object representing the bar chart.
     """
-    df = data_cache.get_or_update_data()
+    data_cache.get_or_update_data()
+    # Charts are generated concurrently, so the figure cache is looked up before the data
+    # (see DataCache._set_data)
+    cached_figures = data_cache.cached_figures
+    _, df, _ = data_cache.data
+    if chart_func in cached_figures:
+        _logger.info("Using cached chart.")
+        return cached_figures[chart_func]
     _logger.info("Generating chart...")
     fig = chart_func(df)
+    cached_figures[chart_func] = fig
     _logger.info("Chart generated successfully.")
     return fig
 
 
-# Revenue vs Expense totals
-
-
-def display_business_revenue_vs_expense_and_tax_totals() -> go.Figure:
-    """Displays the business expense vs. revenue totals chart."""
-    return generate_chart(graph_business_revenue_vs_expense_and_tax_totals)
-
-
-def display_personal_revenue_vs_expense_and_saving_totals() -> go.Figure:
-    """Displays the personal expense vs. revenue totals chart."""
-    return generate_chart(graph_personal_revenue_vs_expense_and_saving_totals)
-
-
-# Business by category
-
-
-def display_business_revenue_by_subcategory() -> go.Figure:
-    return generate_chart(graph_business_revenue_by_subcategory)
-
-
-def display_business_expenses_by_subcategory() -> go.Figure:
-    return generate_chart(graph_business_expenses_by_subcategory)
-
-
-def display_business_expenses_and_taxes_by_subcategory() -> go.Figure:
-    return generate_chart(graph_business_expenses_and_taxes_by_subcategory)
-
-
-# Personal by category
-
-
-def display_personal_revenue_by_subcategory() -> go.Figure:
-    return generate_chart(graph_personal_revenue_by_subcategory)
-
-
-def display_personal_expenses_by_subcategory() -> go.Figure:
-    return generate_chart(graph_personal_expenses_by_subcategory)
-
-
-def display_personal_expenses_and_savings_by_subcategory() -> go.Figure:
-    return generate_chart(graph_personal_expenses_and_savings_by_subcategory)
-
-
 async def main():
-    load_dotenv()
-
     gradio_server_name = os.environ.get("GRADIO_SERVER_NAME", "0.0.0.0")
     gradio_server_port = os.environ.get("GRADIO_SERVER_PORT", "7860")
     gradio_user_password = os.environ.get("GRADIO_PASSWORD")
+    gradio_concurrency_limit = os.environ.get("GRADIO_CONCURRENCY_LIMIT", "4")
 
     auth_fn = (
         (lambda _username, password: password == gradio_user_password)
@@ -133,16 +256,29 @@ async def main():
     # Mapping of chart names to functions
     # pylint: disable=line-too-long
     chart_functions = {
-        "Business Revenue vs Expense (and Tax) - Totals": display_business_revenue_vs_expense_and_tax_totals,
-        "Personal Revenue vs Expense (and Saving) - Totals": display_personal_revenue_vs_expense_and_saving_totals,
-        "Business Revenue - by Category": display_business_revenue_by_subcategory,
-        "Business Expenses - by Category": display_business_expenses_by_subcategory,
-        "Business Expenses (and Taxes) - by Category": display_business_expenses_and_taxes_by_subcategory,
-        "Personal Revenue - by Category": display_personal_revenue_by_subcategory,
-        "Personal Expenses - by Category": display_personal_expenses_by_subcategory,
-        "Personal Expenses (and Savings) - by Category": display_personal_expenses_and_savings_by_subcategory,
+        chart_name: functools.partial(generate_chart, graph_func)
+        for chart_name, graph_func in {
+            "Business Revenue vs Expense (and Tax) - Totals": graph_business_revenue_vs_expense_and_tax_totals,
+            "Personal Revenue vs Expense (and Saving) - Totals": graph_personal_revenue_vs_expense_and_saving_totals,
+            "Business Revenue - by Category": graph_business_revenue_by_subcategory,
+            "Business Expenses - by Category": graph_business_expenses_by_subcategory,
+            "Business Expenses (and Taxes) - by Category": graph_business_expenses_and_taxes_by_subcategory,
+            "Personal Revenue - by Category": graph_personal_revenue_by_subcategory,
+            "Personal Expenses - by Category": graph_personal_expenses_by_subcategory,
+            "Personal Expenses (and Savings) - by Category": graph_personal_expenses_and_savings_by_subcategory,
+        }.items()
     }
 
+    chart_names = list(chart_functions)
+
+    async def warm_chart_cache():
+        """Generates all charts concurrently in worker threads, so they are already cached
+        when they are first requested.
+        """
+        await asyncio.gather(
+            *(asyncio.to_thread(chart_func) for chart_func in chart_functions.values())
+        )
+
     # Set up Gradio interface
     with gr.Blocks(
         theme=gr.themes.Soft(),
@@ -155,18 +291,25 @@ async def main():
         gr.Markdown("### Update Data")
         update_data_btn = gr.Button("Update Data")
         update_data_output = gr.Textbox(label="Update Status")
-        update_data_btn.click(data_cache.update_cached_data, outputs=update_data_output)
+        download_data_btn = gr.DownloadButton("Download Data")
+        # Data updates run one at a time (unlike chart rendering), as every update sends
+        # several queries to the rate-limited Notion API
+        update_data_btn.click(
+            data_cache.update_cached_data,
+            outputs=update_data_output,
+            concurrency_limit=1,
+        ).then(data_cache.export_data, outputs=download_data_btn).then(warm_chart_cache)
 
         gr.Markdown("### Select Charts to Display")
         chart_dropdown1 = gr.Dropdown(
-            choices=list(chart_functions.keys()),
+            choices=chart_names,
             label="Select First Chart",
-            value=list(chart_functions.keys())[0],
+            value=chart_names[0],
         )
         chart_dropdown2 = gr.Dropdown(
-            choices=list(chart_functions.keys()),
+            choices=chart_names,
             label="Select Second Chart",
-            value=list(chart_functions.keys())[1],
+            value=chart_names[1],
         )
         display_chart_btn = gr.Button("Display Charts")
         chart_output1 = gr.Plot()
@@ -184,7 +327,19 @@ async def main():
             outputs=[chart_output1, chart_output2],
         )
 
-    demo.queue()
+        # The export is attached on page load (in a worker thread, like all synchronous
+        # event handlers) rather than passed as a callable value, which Gradio would call
+        # on the event loop while building the Blocks and on every page load
+        demo.load(data_cache.export_data, outputs=download_data_btn)
+
+    # Load the data and generate the charts before the server starts, so the first
+    # requests do not all wait on (and concurrently trigger) a fetch from Notion
+    await asyncio.to_thread(data_cache.get_or_update_data)
+    await warm_chart_cache()
+
+    # Chart generation only reads the cached data, so several requests can be served at
+    # once instead of one at a time (Gradio's default)
+    demo.queue(default_concurrency_limit=int(gradio_concurrency_limit))
     demo.launch(
         server_name=gradio_server_name,
         server_port=int(gradio_server_port),
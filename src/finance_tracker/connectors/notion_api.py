@@ -1,44 +1,210 @@
 """Getting data from Notion API"""
 
+import functools
+import logging
 import os
+from urllib.parse import unquote
 
+import orjson
 import requests
-from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-load_dotenv()
+_logger = logging.getLogger(__name__)
 
-NOTION_TOKEN = os.getenv("NOTION_TOKEN")
 
+@functools.cache
+def get_notion_token() -> str | None:
+    """
+    Returns the Notion integration token from the "NOTION_TOKEN" environment variable.
+
+    The variable is read lazily (and only once), so the entrypoint can load it from a .env
+    file after this module is imported.
 
-def get_database(database_id: str, num_pages: int | None = None):
+    Returns:
+        str | None: The Notion integration token, or None if it is not set.
     """
-    If num_pages is None, get all pages, otherwise just the defined number.
+    return os.getenv("NOTION_TOKEN")
+
+
+@functools.cache
+def _get_session() -> requests.Session:
     """
+    Returns the process-wide session used for all Notion API requests.
 
-    headers = {
-        "Authorization": "Bearer " + NOTION_TOKEN,
-        "Content-Type": "application/json",
-        "Notion-Version": "2022-06-28",
-    }
+    Reusing one session keeps the HTTPS connections alive between paginated requests (and
+    between data refreshes), so the TCP and TLS handshakes are only paid once per pooled
+    connection. Rate limited (HTTP 429) and transiently failing requests are retried with
+    exponential backoff, honouring Notion's "Retry-After" header.
+
+    Returns:
+        requests.Session: The configured session.
+    """
+    session = requests.Session()
+    retries = Retry(
+        total=3,
+        backoff_factor=0.5,
+        status_forcelist=[429, 502, 503],
+        # Database queries are read-only POST requests, so they are safe to retry
+        allowed_methods=None,
+    )
+    session.mount(
+        "https://",
+        HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=retries),
+    )
+    session.headers.update(
+        {
+            "Authorization": "Bearer " + get_notion_token(),
+            "Content-Type": "application/json",
+            "Notion-Version": "2022-06-28",
+        }
+    )
+    return session
+
+
+def _query(
+    url: str, payload: dict, params: list[tuple[str, str]] | None = None
+) -> dict:
+    """
+    Sends a query to the Notion API.
+
+    The payload is encoded and the (large, deeply nested) response decoded with orjson,
+    which is several times faster than the standard library json module.
+
+    Args:
+        url (str): The query endpoint.
+        payload (dict): The JSON body of the query.
+        params (list[tuple[str, str]] | None): Optional query string parameters.
+
+    Returns:
+        dict: The decoded JSON response.
+    """
+    response = _get_session().post(
+        url, data=orjson.dumps(payload), params=params, timeout=60
+    )
+    return orjson.loads(response.content)
+
+
+@functools.cache
+def get_database_property_ids(database_id: str) -> dict[str, str]:
+    """
+    Gets the IDs of the properties (columns) of a Notion database.
+
+    The database schema rarely changes, so it is only fetched once per process.
+
+    Args:
+        database_id (str): The ID of the Notion database.
+
+    Returns:
+        dict[str, str]: A dictionary where the keys are property names and the values are
+            the corresponding (URL-decoded) property IDs.
+    """
+    response = _get_session().get(
+        f"https://api.notion.com/v1/databases/{database_id}", timeout=60
+    )
+    properties = orjson.loads(response.content)["properties"]
+    # Notion sends the IDs URL-encoded (e.g. "%3AUPp"), but they are encoded again when
+    # passed as query string parameters
+    return {name: unquote(prop["id"]) for name, prop in properties.items()}
+
+
+def get_database(
+    database_id: str,
+    num_pages: int | None = None,
+    property_ids: list[str] | None = None,
+    since: str | None = None,
+    query_filter: dict | None = None,
+):
+    """
+    If num_pages is None, get all pages, otherwise just the defined number.
+
+    If property_ids is given, only those properties are returned for each page (see
+    `get_database_property_ids`), which can shrink the response considerably for databases
+    with many unused properties. A warning is logged if any of them are missing from the
+    returned pages.
+
+    If since is given (an ISO 8601 "last_edited_time" as returned by Notion), only the
+    pages edited at or after it are returned. The pages are then requested most recently
+    edited first, so the pagination stops at the first page older than since instead of
+    going through the whole database.
+
+    If query_filter is given, only the pages matching that Notion filter object are
+    returned.
+    """
 
     url = f"https://api.notion.com/v1/databases/{database_id}/query"
+    params = (
+        [("filter_properties", property_id) for property_id in property_ids]
+        if property_ids is not None
+        else None
+    )
 
     get_all = num_pages is None
     page_size = 100 if get_all else num_pages
 
     payload = {"page_size": page_size}
-    response = requests.post(url, json=payload, headers=headers, timeout=60)
-    data = response.json()
+    if query_filter is not None:
+        payload["filter"] = query_filter
+    if since is not None:
+        payload["sorts"] = [
+            {"timestamp": "last_edited_time", "direction": "descending"}
+        ]
+    data = _query(url, payload, params)
 
     # json_data = json.dumps(data, indent=4)
     # print(json_data)
 
     database_pages = data["results"]
     while data["has_more"] and get_all:
-        payload = {"page_size": page_size, "start_cursor": data["next_cursor"]}
-        url = f"https://api.notion.com/v1/databases/{database_id}/query"
-        response = requests.post(url, json=payload, headers=headers, timeout=60)
-        data = response.json()
+        # Notion's timestamps all have the same format, so they compare as strings
+        if since is not None and database_pages[-1]["last_edited_time"] < since:
+            break
+        payload["start_cursor"] = data["next_cursor"]
+        data = _query(url, payload, params)
         database_pages.extend(data["results"])
 
+    if since is not None:
+        database_pages = [
+            page for page in database_pages if page["last_edited_time"] >= since
+        ]
+
+    if property_ids is not None and database_pages:
+        returned_ids = {
+            unquote(prop["id"]) for prop in database_pages[0]["properties"].values()
+        }
+        missing_ids = [
+            property_id
+            for property_id in property_ids
+            if property_id not in returned_ids
+        ]
+        if missing_ids:
+            _logger.warning(
+                "Properties %s of database %s are missing from the returned pages.",
+                missing_ids,
+                database_id,
+            )
+
     return database_pages
+
+
+def get_last_edited_time(database_id: str) -> str | None:
+    """
+    Gets the most recent "last_edited_time" of all pages in a Notion database.
+
+    Only the most recently edited page is requested, which makes this a cheap way to check
+    whether a database has changed since it was last fetched.
+
+    Args:
+        database_id (str): The ID of the Notion database.
+
+    Returns:
+        str | None: The ISO 8601 timestamp of the most recent edit, or None if the database
+            has no pages.
+    """
+    url = f"https://api.notion.com/v1/databases/{database_id}/query"
+    payload = {
+        "page_size": 1,
+        "sorts": [{"timestamp": "last_edited_time", "direction": "descending"}],
+    }
+    results = _query(url, payload)["results"]
+    return results[0]["last_edited_time"] if results else None
@@ -1,26 +1,98 @@
 """For converting data from Notion API into Pandas DataFrames"""
 
+import datetime
+import functools
 import logging
 import os
-from datetime import datetime
+import tempfile
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
 
+import orjson
 import pandas as pd
-from dotenv import load_dotenv
 
 from finance_tracker.connectors import notion_utils
-from finance_tracker.connectors.notion_api import get_database
+from finance_tracker.connectors.notion_api import (
+    get_database,
+    get_database_property_ids,
+    get_last_edited_time,
+)
 from finance_tracker.utils.utils import timing_decorator
 
-FINANCE_TRACKER_DATABASE_ID = os.getenv("FINANCE_TRACKER_DATABASE_ID")
-SUB_CATEGORIES_DATABASE_ID = os.getenv("SUB_CATEGORIES_DATABASE_ID")
-MAIN_CATEGORIES_DATABASE_ID = os.getenv("MAIN_CATEGORIES_DATABASE_ID")
+# The only properties of the finance tracker database that are used
+FINANCE_TRACKER_PROPERTIES = (
+    "Name",
+    "Date",
+    "Amount",
+    "Account",
+    "Cash Flow Type",
+    "Business Related?",
+    "Sub Category",
+)
+
+# The UTC offset at the end of a timed ISO 8601 date string ("Z" or e.g. "+09:00")
+_UTC_OFFSET_PATTERN = r"(?:Z|[+-]\d{2}:\d{2})$"
 
 logging.basicConfig(level=logging.INFO)
 _logger = logging.getLogger(__name__)
 
+# Shared by all data refreshes, so the worker threads are not recreated on every refresh
+_fetch_executor = ThreadPoolExecutor(max_workers=3, thread_name_prefix="notion-fetch")
+# Separate from _fetch_executor, whose workers wait on the partitions
+_partition_executor = ThreadPoolExecutor(
+    max_workers=3, thread_name_prefix="notion-partition"
+)
+
+
+# The environment variables are read lazily (and only once), so the entrypoint can load
+# them from a .env file after this module is imported
+@functools.cache
+def get_finance_tracker_database_id() -> str | None:
+    """Returns the ID of the finance tracker Notion database."""
+    return os.getenv("FINANCE_TRACKER_DATABASE_ID")
+
+
+@functools.cache
+def get_sub_categories_database_id() -> str | None:
+    """Returns the ID of the sub-categories Notion database."""
+    return os.getenv("SUB_CATEGORIES_DATABASE_ID")
+
+
+@functools.cache
+def get_main_categories_database_id() -> str | None:
+    """Returns the ID of the main categories Notion database."""
+    return os.getenv("MAIN_CATEGORIES_DATABASE_ID")
+
+
+@functools.cache
+def get_notion_cache_dir() -> str:
+    """Returns the directory in which fetched Notion pages are cached."""
+    return os.getenv("NOTION_CACHE_DIR", "output")
+
+
+@functools.cache
+def _get_finance_tracker_cache_path() -> str:
+    """
+    Returns the path of the on-disk cache of the finance tracker pages.
+
+    The path is resolved, and its directory created, only once per process rather than on
+    every data refresh.
+
+    Returns:
+        str: The path of the cache file.
+    """
+    cache_dir = get_notion_cache_dir()
+    os.makedirs(cache_dir, exist_ok=True)
+    return os.path.join(
+        cache_dir, f"notion_cache_{get_finance_tracker_database_id()}.json"
+    )
+
 
 @timing_decorator
-def get_sub_to_main_categories_mapping():
+def get_sub_to_main_categories_mapping(
+    sub_category_pages: list[dict] | None = None,
+    main_category_pages: list[dict] | None = None,
+):
     """
     Creates a mapping of sub-categories to their corresponding main categories.
 
@@ -28,52 +100,342 @@ def get_sub_to_main_categories_mapping():
     respective main categories using another Notion database. The mapping is stored in a
     dictionary, where the keys are sub-category names and the values are main category names.
 
+    Args:
+        sub_category_pages (list[dict] | None): Already fetched pages of the sub-categories
+            database. Fetched from Notion if None.
+        main_category_pages (list[dict] | None): Already fetched pages of the main categories
+            database. Fetched from Notion if None.
+
     Returns:
         dict: A dictionary where the keys are sub-category names and the values are the
             corresponding main category names.
     """
-    pages = get_database(SUB_CATEGORIES_DATABASE_ID)
+    if sub_category_pages is None:
+        sub_category_pages = get_database(get_sub_categories_database_id())
+    if main_category_pages is None:
+        main_category_pages = get_database(get_main_categories_database_id())
 
-    maincategories_page_name_mapping = notion_utils.get_page_name_mapping(
-        MAIN_CATEGORIES_DATABASE_ID
+    maincategories_page_name_mapping = notion_utils.get_page_name_mapping_from_pages(
+        main_category_pages
     )
 
     get_sub_to_main_categories_mapping_dict = {}
-    for page in pages:
+    # Bind the functions used in the loop to locals, which are faster to look up than
+    # module attributes and globals
+    extract_relation_type_info = notion_utils.extract_relation_type_info
+    get_main_category_name = maincategories_page_name_mapping.get
+    for page in sub_category_pages:
         try:
-            # page_id = page["id"]
             props = page["properties"]
-            if not props:
-                pass
+            title = props["Name"]["title"]
+            if not title:
+                _logger.debug("Skipping page without a name: %s", page)
+                continue
 
-            name = props["Name"]["title"][0]["text"]["content"]
-            main_category_info = notion_utils.extract_relation_type_info(
+            name = title[0]["text"]["content"]
+            main_category_info = extract_relation_type_info(
                 props, "Main Finance Categories"
             )
             if main_category_info:
                 main_category_id = main_category_info[0].get("id", None)
-                main_category_name = maincategories_page_name_mapping.get(
-                    main_category_id, None
-                )
+                main_category_name = get_main_category_name(main_category_id, None)
             else:
-                main_category_id = None
                 main_category_name = None
 
             get_sub_to_main_categories_mapping_dict[name] = main_category_name
-        except:
+        except (KeyError, TypeError, IndexError):
             _logger.debug("Trouble adding page: %s", page)
 
     return get_sub_to_main_categories_mapping_dict
 
 
+def _get_database_in_partitions(
+    database_id: str, property_ids: list[str] | None = None
+) -> list[dict]:
+    """
+    Fetches all pages of a Notion database as partitions that are paginated concurrently.
+
+    Cursor-based pagination can only request one page of results after another, so the
+    database is split by the year its pages were created in (this year, last year and
+    earlier years), and the partitions are paginated in parallel worker threads. Every
+    page has exactly one "created_time", so each page is in exactly one partition.
+
+    Args:
+        database_id (str): The ID of the Notion database.
+        property_ids (list[str] | None): The IDs of the properties to fetch (see
+            `get_database`).
+
+    Returns:
+        list[dict]: The pages of the database.
+    """
+    year = datetime.date.today().year
+    this_year = f"{year}-01-01"
+    last_year = f"{year - 1}-01-01"
+    query_filters = [
+        {"timestamp": "created_time", "created_time": {"on_or_after": this_year}},
+        {
+            "and": [
+                {
+                    "timestamp": "created_time",
+                    "created_time": {"on_or_after": last_year},
+                },
+                {"timestamp": "created_time", "created_time": {"before": this_year}},
+            ]
+        },
+        {"timestamp": "created_time", "created_time": {"before": last_year}},
+    ]
+    futures = [
+        _partition_executor.submit(
+            get_database,
+            database_id,
+            property_ids=property_ids,
+            query_filter=query_filter,
+        )
+        for query_filter in query_filters
+    ]
+
+    database_pages = []
+    for future in futures:
+        database_pages.extend(future.result())
+    return database_pages
+
+
+def _write_finance_tracker_cache(
+    cache_path: str,
+    last_edited_time: str | None,
+    property_ids: list[str],
+    pages: list[dict],
+) -> None:
+    """
+    Writes the pages of the finance tracker database to the on-disk cache.
+
+    The pages are written to a temporary file that then replaces the cache file, so
+    concurrent refreshes (or a process dying mid-write) never leave a truncated cache.
+
+    Args:
+        cache_path (str): The path of the cache file.
+        last_edited_time (str | None): The most recent "last_edited_time" of the database.
+        property_ids (list[str]): The IDs of the properties that were fetched.
+        pages (list[dict]): The pages of the finance tracker database.
+    """
+    with tempfile.NamedTemporaryFile(
+        dir=os.path.dirname(cache_path), suffix=".tmp", delete=False
+    ) as f:
+        f.write(
+            orjson.dumps(
+                {
+                    "last_edited_time": last_edited_time,
+                    "property_ids": property_ids,
+                    "pages": pages,
+                }
+            )
+        )
+    try:
+        os.replace(f.name, cache_path)
+    except OSError:
+        os.remove(f.name)
+        raise
+
+
+def _read_finance_tracker_cache(cache_path: str) -> dict | None:
+    """
+    Reads the on-disk cache of the finance tracker pages.
+
+    Args:
+        cache_path (str): The path of the cache file.
+
+    Returns:
+        dict | None: The cached "last_edited_time", "property_ids" and "pages", or None if
+            there is no cache or it cannot be read (in which case all pages are fetched).
+    """
+    try:
+        with open(cache_path, "rb") as f:
+            cache = orjson.loads(f.read())
+        return {
+            "last_edited_time": cache["last_edited_time"],
+            "property_ids": cache["property_ids"],
+            "pages": cache["pages"],
+        }
+    except FileNotFoundError:
+        return None
+    except (OSError, orjson.JSONDecodeError, KeyError, TypeError) as e:
+        _logger.warning(
+            "Ignoring unreadable finance tracker cache %s: %s", cache_path, e
+        )
+        return None
+
+
 @timing_decorator
-def get_finance_tracker_pages():
-    pages = get_database(FINANCE_TRACKER_DATABASE_ID)
+def get_finance_tracker_pages(use_cache: bool = True):
+    """
+    Fetches all pages of the finance tracker Notion database, using an on-disk cache.
+
+    The pages are cached in `get_notion_cache_dir()` together with the most recent
+    "last_edited_time" of the database. On each call only the pages edited since then
+    (including the same minute, as Notion truncates the timestamps to the minute) are
+    fetched and merged into the cached pages, instead of paginating through the whole
+    database. If none of them changed, the cached pages are returned as they are.
+
+    Deleting a page does not change the most recent "last_edited_time" of the remaining
+    pages, so pass `use_cache=False` to force a full fetch (the cache is still updated).
+
+    Only the properties in `FINANCE_TRACKER_PROPERTIES` are fetched.
+
+    Args:
+        use_cache (bool): Whether to use the cached pages instead of fetching all pages.
+
+    Returns:
+        list[dict]: The pages of the finance tracker database.
+    """
+    database_id = get_finance_tracker_database_id()
+    cache_path = _get_finance_tracker_cache_path()
+    last_edited_time = get_last_edited_time(database_id)
+    property_ids = get_database_property_ids(database_id)
+    property_ids = [
+        property_ids[name]
+        for name in FINANCE_TRACKER_PROPERTIES
+        if name in property_ids
+    ]
+
+    cache = _read_finance_tracker_cache(cache_path) if use_cache else None
+    if (
+        cache is not None
+        and cache["property_ids"] == property_ids
+        and cache["last_edited_time"] is not None
+    ):
+        # Notion truncates "last_edited_time" to the minute, so even an unchanged
+        # timestamp may hide an edit made in the same minute as the last fetch. The
+        # query includes the pages edited in that minute
+        pages_by_id = {page["id"]: page for page in cache["pages"]}
+        changed = False
+        for page in get_database(
+            database_id, property_ids=property_ids, since=cache["last_edited_time"]
+        ):
+            if pages_by_id.get(page["id"]) != page:
+                pages_by_id[page["id"]] = page
+                changed = True
+
+        if not changed and cache["last_edited_time"] == last_edited_time:
+            _logger.info("Finance tracker database unchanged, using cached pages.")
+            return cache["pages"]
+
+        _logger.info("Merging finance tracker pages edited since last fetch.")
+        pages = list(pages_by_id.values())
+        _write_finance_tracker_cache(cache_path, last_edited_time, property_ids, pages)
+        return pages
+
+    pages = _get_database_in_partitions(database_id, property_ids=property_ids)
+
+    _write_finance_tracker_cache(cache_path, last_edited_time, property_ids, pages)
     return pages
 
 
 @timing_decorator
-def get_finance_tracker_df():
+def get_all_database_pages(
+    use_cache: bool = True,
+) -> tuple[list[dict], list[dict], list[dict]]:
+    """
+    Concurrently fetches the pages of the sub-categories, main categories and finance
+    tracker Notion databases.
+
+    The three databases are independent of each other, so their (sequential) paginations
+    are run in parallel worker threads instead of one after the other.
+
+    Args:
+        use_cache (bool): Whether the finance tracker pages may be served from the on-disk
+            cache (see `get_finance_tracker_pages`).
+
+    Returns:
+        tuple[list[dict], list[dict], list[dict]]: The sub-category pages, the main
+            category pages and the finance tracker pages.
+    """
+    sub_category_future = _fetch_executor.submit(
+        get_database, get_sub_categories_database_id()
+    )
+    main_category_future = _fetch_executor.submit(
+        get_database, get_main_categories_database_id()
+    )
+    finance_tracker_future = _fetch_executor.submit(
+        get_finance_tracker_pages, use_cache
+    )
+    return (
+        sub_category_future.result(),
+        main_category_future.result(),
+        finance_tracker_future.result(),
+    )
+
+
+def _extract_finance_tracker_row(props: dict) -> tuple | None:
+    """
+    Extracts the used property values from the properties of a finance tracker page.
+
+    The schema of the finance tracker database is fixed, so the extraction is specialized to
+    it: straight-line lookups instead of the generic `notion_utils.extract_*_type_info`
+    helpers, which this runs once per page. A property's nested key (e.g. "select") is always
+    present when the property itself is.
+
+    Args:
+        props (dict): The properties of a finance tracker page.
+
+    Returns:
+        tuple | None: The name, ISO 8601 date string, amount, account, cash flow type,
+            business related status and sub-category ID of the page, with None for missing
+            values. None if the page has no name or date (e.g. a row still being filled
+            in), which is common enough not to go through exception handling.
+
+    Raises:
+        KeyError, TypeError, IndexError: If a property is malformed.
+    """
+    title = props["Name"]["title"]
+    date = props["Date"]["date"]
+    if not title or date is None:
+        return None
+
+    account = props["Account"]["select"] if "Account" in props else None
+    cash_flow_type = (
+        props["Cash Flow Type"]["select"] if "Cash Flow Type" in props else None
+    )
+    business_related = (
+        props["Business Related?"]["select"] if "Business Related?" in props else None
+    )
+    sub_category = (
+        props["Sub Category"]["relation"] if "Sub Category" in props else None
+    )
+    return (
+        title[0]["text"]["content"],
+        date["start"],
+        props["Amount"]["number"] if "Amount" in props else None,
+        account["name"] if account else None,
+        cash_flow_type["name"] if cash_flow_type else None,
+        business_related["name"] if business_related else None,
+        sub_category[0]["id"] if sub_category else None,
+    )
+
+
+def _parse_notion_dates(dates: Sequence[str]) -> pd.Series:
+    """
+    Parses the ISO 8601 date strings of a Notion date property.
+
+    Notion dates are either date-only ("2024-01-01") or timed with a UTC offset
+    ("2024-01-31T23:30:00.000+09:00"). The offsets are dropped, keeping the date and time as
+    entered, so a mix of both (or of different offsets) parses to a single tz-naive column
+    and every transaction stays in the month it was entered in.
+
+    Args:
+        dates (Sequence[str]): The ISO 8601 date strings.
+
+    Returns:
+        pd.Series: The dates, as a tz-naive datetime64 column.
+    """
+    wall_clock_dates = pd.Series(dates, dtype=object).str.replace(
+        _UTC_OFFSET_PATTERN, "", regex=True
+    )
+    # Parse all the date strings in one vectorized call
+    return pd.to_datetime(wall_clock_dates, format="ISO8601", cache=True)
+
+
+@timing_decorator
+def get_finance_tracker_df(use_cache: bool = True):
     """
     Fetches data from the finance tracker Notion database and converts it into a Pandas DataFrame,
     using cached data if it hasn't changed.
@@ -82,62 +444,78 @@ def get_finance_tracker_df():
     type, and category information. It maps sub-categories to main categories and organizes the
     data into a structured DataFrame.
 
+    Args:
+        use_cache (bool): Whether the finance tracker pages may be served from the on-disk
+            cache when the database is unchanged.
+
     Returns:
         pd.DataFrame: A DataFrame containing financial data with the following columns:
         ['name', 'date', 'amount', 'account', 'cash_flow_type', 'business_related',
         'sub_category', 'main_category'].
     """
-    load_dotenv()
-
-    subcategories_page_name_mapping = notion_utils.get_page_name_mapping(
-        SUB_CATEGORIES_DATABASE_ID
+    sub_category_pages, main_category_pages, pages = get_all_database_pages(
+        use_cache=use_cache
     )
-    get_sub_to_main_categories_mapping_dict = get_sub_to_main_categories_mapping()
 
-    pages = get_finance_tracker_pages()
+    subcategories_page_name_mapping = notion_utils.get_page_name_mapping_from_pages(
+        sub_category_pages
+    )
+    get_sub_to_main_categories_mapping_dict = get_sub_to_main_categories_mapping(
+        sub_category_pages=sub_category_pages, main_category_pages=main_category_pages
+    )
 
-    page_dicts = []
+    rows = []
+    # Local aliases save a global and an attribute lookup per page
+    extract_row = _extract_finance_tracker_row
+    append_row = rows.append
     for page in pages:
         try:
-            page_dict = {}
-
-            # page_id = page["id"]
-            props = page["properties"]
-            if not props:
-                pass
-
-            # Get all properties for each page and put in page_dict
-            page_dict["name"] = props["Name"]["title"][0]["text"]["content"]
-            date = props["Date"]["date"]["start"]
-            page_dict["date"] = datetime.fromisoformat(date)
-            page_dict["amount"] = notion_utils.extract_number_type_info(props, "Amount")
-            page_dict["account"] = notion_utils.extract_select_type_info(
-                props, "Account"
-            )
-            page_dict["cash_flow_type"] = notion_utils.extract_select_type_info(
-                props, "Cash Flow Type"
-            )
-            page_dict["business_related"] = notion_utils.extract_select_type_info(
-                props, "Business Related?"
-            )
-            sub_category_info = notion_utils.extract_relation_type_info(
-                props, "Sub Category"
-            )
-            if sub_category_info:
-                sub_category_id = sub_category_info[0].get("id", None)
-                sub_category_name = subcategories_page_name_mapping.get(
-                    sub_category_id, None
-                )
-            else:
-                sub_category_name = None
-            page_dict["sub_category"] = sub_category_name
-            page_dict["main_category"] = get_sub_to_main_categories_mapping_dict.get(
-                sub_category_name, None
-            )
-            page_dicts.append(page_dict)
-        except:
+            row = extract_row(page["properties"])
+        except (KeyError, TypeError, IndexError):
             _logger.debug("Trouble adding page: %s", page)
+            continue
+        if row is None:
+            _logger.debug("Skipping page without a name or date: %s", page)
+            continue
+        append_row(row)
+
+    # Transpose the rows into one sequence per column, so the DataFrame is built column by
+    # column rather than from per-row records
+    columns = zip(*rows) if rows else [()] * 7
+    (
+        names,
+        dates,
+        amounts,
+        accounts,
+        cash_flow_types,
+        business_related,
+        sub_category_ids,
+    ) = columns
+
+    # Every column is built with an explicit dtype, so pandas never has to scan the
+    # values to infer one. Low-cardinality columns are stored as categoricals, which are
+    # much smaller than object columns and faster to filter and group on
+    df = pd.DataFrame(
+        {
+            "name": pd.Series(names, dtype=object),
+            "date": _parse_notion_dates(dates),
+            "amount": pd.Series(amounts, dtype="float64"),
+            "account": pd.Categorical(accounts),
+            "cash_flow_type": pd.Categorical(cash_flow_types),
+            "business_related": pd.Categorical(business_related),
+            "sub_category": pd.Series(sub_category_ids, dtype=object),
+        },
+        copy=False,
+    )
 
-    df = pd.DataFrame.from_dict(page_dicts)
+    # Resolve the sub-category IDs to names and then to main categories with vectorized
+    # lookups, rather than with two dict lookups per row inside the loop above. Both are
+    # stored as categoricals (with their categories in sorted order), like the other
+    # low-cardinality columns
+    sub_category_names = df["sub_category"].map(subcategories_page_name_mapping)
+    df["sub_category"] = sub_category_names.astype("category")
+    df["main_category"] = sub_category_names.map(
+        get_sub_to_main_categories_mapping_dict
+    ).astype("category")
 
     return df
@@ -1,7 +1,5 @@
 """Utils for dealing with data from Notion API"""
 
-from finance_tracker.connectors.notion_api import get_database
-
 
 def get_page_name_mapping(database_id: str) -> dict:
     """
@@ -15,19 +13,37 @@ def get_page_name_mapping(database_id: str) -> dict:
         dict: A dictionary where the keys are page IDs and the values are the corresponding
             page names
     """
+    # Imported here, so the extractors (which only work on already fetched pages) can be
+    # imported without requests and the rest of the Notion API client
+    # pylint: disable=import-outside-toplevel
+    from finance_tracker.connectors.notion_api import get_database
+
     # Fetch pages using the existing get_database function
     database_pages = get_database(database_id)
+    return get_page_name_mapping_from_pages(database_pages)
+
+
+def get_page_name_mapping_from_pages(database_pages: list[dict]) -> dict:
+    """
+    Creates a dictionary mapping page IDs to page names from already fetched pages.
+
+    Args:
+        database_pages (list[dict]): The pages of a Notion database, as returned by
+            `get_database`.
 
+    Returns:
+        dict: A dictionary where the keys are page IDs and the values are the corresponding
+            page names
+    """
     page_name_mapping = {}
     for page in database_pages:
-        page_id = page.get("id")
-        page_name = (
-            page.get("properties", {})
-            .get("Name", {})
-            .get("title", [{}])[0]
-            .get("text", {})
-            .get("content")
-        )
+        # Direct subscripts instead of chained .get() calls with fallback containers;
+        # pages without an ID or name are rare, so they go through exception handling
+        try:
+            page_id = page["id"]
+            page_name = page["properties"]["Name"]["title"][0]["text"]["content"]
+        except (KeyError, TypeError, IndexError):
+            continue
         if page_id and page_name:
             page_name_mapping[page_id] = page_name
 
@@ -53,14 +69,15 @@ def extract_select_type_info(props: dict, column_name: str) -> str | None:
             returned. If the column does not exist or if the "select"
             key is null, None is returned.
     """
-    select_dict = props.get(column_name, {}).get("select", None)
-    if select_dict is not None:
-        selected_option = select_dict.get("name", None)
-    else:
+    # Look up the column once rather than allocating a fallback {} when it is missing
+    column = props.get(column_name)
+    if column is None:
+        return None
+    select_dict = column.get("select")
+    if select_dict is None:
         # Handle the case when "select" is null
-        selected_option = None
-
-    return selected_option
+        return None
+    return select_dict.get("name")
 
 
 def extract_number_type_info(props: dict, column_name: str) -> str | None:
@@ -77,8 +94,10 @@ def extract_number_type_info(props: dict, column_name: str) -> str | None:
     Returns:
         str: The number value for the row. If the number information is not found, None is returned.
     """
-    number_value = props.get(column_name, {}).get("number", None)
-    return number_value
+    column = props.get(column_name)
+    if column is None:
+        return None
+    return column.get("number")
 
 
 def extract_relation_type_info(props: dict, column_name: str) -> list | None:
@@ -98,7 +117,10 @@ def extract_relation_type_info(props: dict, column_name: str) -> list | None:
         list: A list of linked page IDs for the relation. If the relation
             information is not found, None is returned.
     """
-    relation_list = props.get(column_name, {}).get("relation", None)
+    column = props.get(column_name)
+    if column is None:
+        return None
+    relation_list = column.get("relation")
     if relation_list is not None:
         # Extract page IDs from the relation (adjust based on your specific needs)
         # related_page_ids = [relation.get("name") for relation in relation_list]
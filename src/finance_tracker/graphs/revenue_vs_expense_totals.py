@@ -3,6 +3,68 @@ import plotly.graph_objects as go
 
 import finance_tracker.graphs.utils as graph_utils
 
+# The only columns used by the revenue vs expense charts
+_COLUMNS = ["date", "cash_flow_type", "amount"]
+
+
+def _get_revenue_vs_expense_df(
+    df: pd.DataFrame, business_related: str, expense_like_cash_flow_type: str
+) -> tuple[pd.DataFrame, pd.Series]:
+    """Gets the revenue, expense and expense-like rows of a DataFrame.
+
+    The rows and the used columns are selected with a single mask (so only they are
+    copied), and the totals are computed with a single groupby, rather than by scanning
+    the DataFrame once per cash flow type.
+
+    Args:
+        df (pd.DataFrame): The input DataFrame containing cash flow data, including columns for
+            ['date', 'business_related', 'cash_flow_type', 'amount']
+        business_related (str): The business-related status to filter by (e.g., "Not
+            Business-Related").
+        expense_like_cash_flow_type (str): The cash flow type that is visualized as an
+            "Expense" (e.g. "Reserved for Taxes").
+
+    Returns:
+        tuple[pd.DataFrame, pd.Series]: The "Revenue" rows, then the "Expense" rows and then
+            the expense-like rows relabelled as "Expense", with a 'month_year' column; and
+            the total amount of each of the three cash flow types (before relabelling).
+    """
+    cash_flow_types = ["Revenue", "Expense", expense_like_cash_flow_type]
+    combined_df = graph_utils.select_chart_data(
+        df,
+        (df["business_related"] == business_related)
+        & df["cash_flow_type"].isin(cash_flow_types),
+        _COLUMNS,
+    )
+
+    # The totals are reindexed by cash flow type, so their groups are not sorted first
+    totals = (
+        combined_df.groupby("cash_flow_type", observed=True, sort=False)["amount"]
+        .sum()
+        .reindex(cash_flow_types, fill_value=0)
+    )
+
+    # Rank the rows as "Revenue" (0), "Expense" (1) or expense-like (2). Mapping the
+    # categorical only maps its categories, not every row
+    cash_flow_type_order = {
+        cash_flow_type: i for i, cash_flow_type in enumerate(cash_flow_types)
+    }
+    ranks = combined_df["cash_flow_type"].map(cash_flow_type_order).astype(int)
+
+    # Relabel the expense-like rows as "Expense" by clipping their rank, instead of
+    # assigning the string to each of them
+    combined_df = combined_df.assign(
+        cash_flow_type=pd.Categorical.from_codes(
+            ranks.clip(upper=1), categories=["Revenue", "Expense"]
+        )
+    )
+
+    # The order of the rows determines the order of the bars, so keep the rows of each
+    # cash flow type together
+    combined_df = combined_df.iloc[ranks.argsort(kind="stable")]
+
+    return combined_df, totals
+
 
 def graph_business_revenue_vs_expense_and_tax_totals(
     df: pd.DataFrame,
@@ -17,37 +79,36 @@ def graph_business_revenue_vs_expense_and_tax_totals(
 
     Args:
         df (pd.DataFrame): The input DataFrame containing cash flow data, including columns for
-            ['date', 'business_related', 'cash_flow_type', 'amount', 'name']
+            ['date', 'business_related', 'cash_flow_type', 'amount']
     Returns:
         go.Figure: A Plotly Figure object representing the bar chart.
     """
-    # Preprocessing
-    df = df.copy()
-    df = df[df["business_related"] == "Business-Related"]
-    df = graph_utils.add_month_year_column(df)
-
+    title = "Business Revenue vs Expense (and Tax) - Totals"
     # Separate data for revenue and expense and create a combined df
     # ("Reserved for Taxes" will be visualized as an "Expense")
-    revenue_df = df[df["cash_flow_type"] == "Revenue"]
-    expense_df = df[df["cash_flow_type"] == "Expense"]
-    taxes_df = df[df["cash_flow_type"] == "Reserved for Taxes"]
-    taxes_df.loc[:, "cash_flow_type"] = "Expense"
-    combined_df = pd.concat([revenue_df, expense_df, taxes_df])
+    combined_df, totals = _get_revenue_vs_expense_df(
+        df, "Business-Related", "Reserved for Taxes"
+    )
+    if combined_df.empty:
+        return graph_utils.plot_no_data_chart(title)
 
-    # Create basic plot
-    fig = graph_utils.plot_basic_monthly_bar_chart(
-        combined_df, "Business Revenue vs Expense (and Tax) - Totals"
+    # The monthly totals are computed once, for both the bars and their annotations
+    monthly_totals = graph_utils.get_monthly_totals(
+        combined_df, "amount", "cash_flow_type"
     )
 
+    # Create basic plot
+    fig = graph_utils.plot_basic_monthly_bar_chart(combined_df, title, monthly_totals)
+
     # Add annotations for monthly totals
     fig = graph_utils.add_monthly_total_annotations(
-        fig, combined_df, "amount", "cash_flow_type"
+        fig, combined_df, "amount", "cash_flow_type", monthly_totals
     )
 
     # Add an annotation displaying the total working capital
-    total_revenue = revenue_df["amount"].sum()
-    total_expenses = expense_df["amount"].sum()
-    total_taxes = taxes_df["amount"].sum()
+    total_revenue = totals["Revenue"]
+    total_expenses = totals["Expense"]
+    total_taxes = totals["Reserved for Taxes"]
     total_working_capital = total_revenue - total_expenses - total_taxes
     working_capital_annotation_text = (
         f"Total After-Tax Working Capital: ¥{total_working_capital:,.2f}"
@@ -74,37 +135,36 @@ def graph_personal_revenue_vs_expense_and_saving_totals(
 
     Args:
         df (pd.DataFrame): The input DataFrame containing cash flow data, including columns for
-            ['date', 'business_related', 'cash_flow_type', 'amount', 'name']
+            ['date', 'business_related', 'cash_flow_type', 'amount']
     Returns:
         go.Figure: A Plotly Figure object representing the bar chart.
     """
-    # Preprocessing
-    df = df.copy()
-    df = df[df["business_related"] == "Not Business-Related"]
-    df = graph_utils.add_month_year_column(df)
-
+    title = "Personal Revenue vs Expense (and Saving) - Totals"
     # Separate data for revenue and expense and create a combined df
     # ("Reserved for Taxes" will be visualized as an "Expense")
-    revenue_df = df[df["cash_flow_type"] == "Revenue"]
-    expense_df = df[df["cash_flow_type"] == "Expense"]
-    savings_df = df[df["cash_flow_type"] == "Transfer to Savings"]
-    savings_df.loc[:, "cash_flow_type"] = "Expense"
-    combined_df = pd.concat([revenue_df, expense_df, savings_df])
+    combined_df, totals = _get_revenue_vs_expense_df(
+        df, "Not Business-Related", "Transfer to Savings"
+    )
+    if combined_df.empty:
+        return graph_utils.plot_no_data_chart(title)
 
-    # Create basic plot
-    fig = graph_utils.plot_basic_monthly_bar_chart(
-        combined_df, "Personal Revenue vs Expense (and Saving) - Totals"
+    # The monthly totals are computed once, for both the bars and their annotations
+    monthly_totals = graph_utils.get_monthly_totals(
+        combined_df, "amount", "cash_flow_type"
     )
 
+    # Create basic plot
+    fig = graph_utils.plot_basic_monthly_bar_chart(combined_df, title, monthly_totals)
+
     # Add annotations for monthly totals
     fig = graph_utils.add_monthly_total_annotations(
-        fig, combined_df, "amount", "cash_flow_type"
+        fig, combined_df, "amount", "cash_flow_type", monthly_totals
     )
 
     # Add an annotation displaying the total working capital
-    total_revenue = revenue_df["amount"].sum()
-    total_expenses = expense_df["amount"].sum()
-    total_savings = savings_df["amount"].sum()
+    total_revenue = totals["Revenue"]
+    total_expenses = totals["Expense"]
+    total_savings = totals["Transfer to Savings"]
     total_working_capital = total_revenue - total_expenses - total_savings
     working_capital_annotation_text = (
         f"Total Personal Wiggle Room: ¥{total_working_capital:,.2f}"
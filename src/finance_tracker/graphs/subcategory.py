@@ -1,9 +1,12 @@
+import numpy as np
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 
 import finance_tracker.graphs.utils as graph_utils
 
+# The only columns used by the sub-category charts
+_COLUMNS = ["date", "amount", "main_category", "sub_category"]
+
 
 def _filter_and_prepare_data(
     df: pd.DataFrame, business_related: str, cash_flow_types: list[str]
@@ -32,57 +35,74 @@ def _filter_and_prepare_data(
         per month), 'amount_monthly_total' (total amount spent across all categories per month),
         and 'color' (mapped from 'main_category' for consistent coloring in charts).
     """
-    df = df.copy()
-    df = df[df["business_related"] == business_related]
-    df = graph_utils.add_month_year_column(df)
-    df = df[df["cash_flow_type"].isin(cash_flow_types)]
+    df = graph_utils.select_chart_data(
+        df,
+        (df["business_related"] == business_related)
+        & df["cash_flow_type"].isin(cash_flow_types),
+        _COLUMNS,
+    )
 
-    # Group by month_year, main_category, and sub_category
+    # Group by month_year, main_category, and sub_category. The groups are not sorted here,
+    # as the rows are sorted once below
     grouped_df = df.groupby(
-        ["month_year", "main_category", "sub_category"], as_index=False
+        ["month_year", "main_category", "sub_category"],
+        as_index=False,
+        observed=True,
+        sort=False,
     )["amount"].sum()
 
-    # Calculate the sum for each main_category per month_year
-    main_category_sum = (
-        grouped_df.groupby(["month_year", "main_category"])["amount"]
-        .sum()
-        .reset_index()
+    # Calculate the sum for each main_category per month_year, and the total amount spent
+    # per month. transform() aligns the sums with the rows of grouped_df, so they do not
+    # have to be merged back in
+    grouped_df["main_category_sum"] = grouped_df.groupby(
+        ["month_year", "main_category"], observed=True, sort=False
+    )["amount"].transform("sum")
+    grouped_df["amount_monthly_total"] = grouped_df.groupby(
+        "month_year", observed=True, sort=False
+    )["amount"].transform("sum")
+
+    # Sort values by main_category and sub_category (and chronologically within each)
+    grouped_df.sort_values(
+        by=["main_category", "sub_category", "month_year"], inplace=True
     )
-    main_category_sum.rename(columns={"amount": "main_category_sum"}, inplace=True)
-
-    # Calculate the total amount spent per month
-    monthly_total = grouped_df.groupby("month_year")["amount"].sum().reset_index()
-
-    # Merge the main category sum back into the grouped DataFrame
-    grouped_df = pd.merge(
-        grouped_df, main_category_sum, on=["month_year", "main_category"], how="left"
-    )
-    grouped_df = pd.merge(
-        grouped_df,
-        monthly_total,
-        on="month_year",
-        how="left",
-        suffixes=("", "_monthly_total"),
-    )
-
-    # Sort values by main_category and sub_category
-    grouped_df.sort_values(by=["main_category", "sub_category"], inplace=True)
 
     # Map sub_categories to the same color as their main_category
     grouped_df["color"] = grouped_df["main_category"].map(
         graph_utils.MAIN_FINANCE_CATEGORIES_COLOR_MAP
     )
 
-    # Define the order of sub-categories within main categories
-    grouped_df["sub_category"] = pd.Categorical(
-        grouped_df["sub_category"],
-        categories=grouped_df["sub_category"].unique(),
-        ordered=True,
+    # Define the order of sub-categories within main categories. factorize() numbers the
+    # sub-categories in order of appearance, which gives the codes and categories of the
+    # ordered categorical in a single pass
+    sub_category_codes, sub_categories = pd.factorize(
+        grouped_df["sub_category"], sort=False
+    )
+    grouped_df["sub_category"] = pd.Categorical.from_codes(
+        sub_category_codes, categories=sub_categories.astype(object), ordered=True
     )
 
     return grouped_df
 
 
+def _get_sub_category_color(sub_category_df: pd.DataFrame) -> str | None:
+    """
+    Gets the color of the bars of a sub-category.
+
+    Sub-categories have the same color as their main category (the last one, if the
+    sub-category occurs under several main categories).
+
+    Args:
+        sub_category_df (pd.DataFrame): The rows of a grouped DataFrame (as returned by
+            `_filter_and_prepare_data`) for a single sub-category.
+
+    Returns:
+        str | None: The color of the main category, or None (for Plotly's default colors) if
+            the main category has no color.
+    """
+    color = sub_category_df["color"].iloc[-1]
+    return color if pd.notna(color) else None
+
+
 def _create_stacked_bar_chart(grouped_df: pd.DataFrame, title: str) -> go.Figure:
     """
     Creates a plotly stacked bar chart of sub-category totals.
@@ -101,33 +121,49 @@ def _create_stacked_bar_chart(grouped_df: pd.DataFrame, title: str) -> go.Figure
     Returns:
         go.Figure: A Plotly Figure object representing the bar chart.
     """
-    fig = px.bar(
-        grouped_df,
-        x="month_year",
-        y="amount",
-        color="sub_category",
+    if grouped_df.empty:
+        return graph_utils.plot_no_data_chart(title)
+
+    # The bars are built with go.Bar rather than px.bar, which would copy and reshape
+    # grouped_df and then need every trace to be recolored. The sub-categories are
+    # ordered categories, so grouping on them yields one trace per sub-category in order
+    fig = go.Figure()
+    for sub_category, sub_category_df in grouped_df.groupby(
+        "sub_category", observed=True
+    ):
+        fig.add_trace(
+            go.Bar(
+                x=sub_category_df["month_year"].tolist(),
+                y=sub_category_df["amount"].to_numpy(),
+                name=sub_category,
+                legendgroup=sub_category,
+                marker_color=_get_sub_category_color(sub_category_df),
+                customdata=sub_category_df[
+                    ["main_category_sum", "main_category"]
+                ].to_numpy(),
+                hovertemplate=(
+                    f"sub_category={sub_category}<br>Amount Spent=%{{y}}<br>"
+                    "main_category_sum=%{customdata[0]}<br>"
+                    "main_category=%{customdata[1]}<extra></extra>"
+                ),
+            )
+        )
+
+    fig.update_layout(
         title=title,
-        hover_data={
-            "main_category_sum": True,
-            "main_category": True,
-            "month_year": False,
-        },
-        labels={"amount": "Amount Spent", "month_year": "Month-Year"},
-        category_orders={"sub_category": grouped_df["sub_category"].unique()},
+        barmode="relative",
+        legend_title_text="sub_category",
+        xaxis_title="Month-Year",
+        yaxis_title="Amount Spent",
+    )
+    fig.update_xaxes(
+        type="category",
+        categoryorder="array",
+        # The months are categories in chronological order, so they do not need to be
+        # sorted (otherwise they would be ordered by their first appearance)
+        categoryarray=grouped_df["month_year"].cat.categories.tolist(),
     )
 
-    # Update traces with custom colors
-    for main_category in grouped_df["main_category"].unique():
-        for trace in fig.data:
-            if (
-                trace.name
-                in grouped_df.loc[
-                    grouped_df["main_category"] == main_category, "sub_category"
-                ].values
-            ):
-                trace.marker.color = graph_utils.MAIN_FINANCE_CATEGORIES_COLOR_MAP[
-                    main_category
-                ]
     # Add annotations for monthly totals
     fig = graph_utils.add_monthly_total_annotations(fig, grouped_df, "amount")
 
@@ -153,34 +189,79 @@ def _create_percent_stacked_bar_chart(grouped_df: pd.DataFrame) -> go.Figure:
     Returns:
         go.Figure: A Plotly Figure object representing the bar chart.
     """
+    # The percentages are computed on the underlying arrays, as the columns are already
+    # aligned and do not need pandas' index alignment. Months whose amounts cancel out to
+    # a total of zero get percentages of zero rather than dividing by zero
+    amount_monthly_total = grouped_df["amount_monthly_total"].to_numpy()
+    has_monthly_total = amount_monthly_total != 0
+
     # Calculate the percentage of total amount for each sub-category
     grouped_df["percentage"] = (
-        grouped_df["amount"] / grouped_df["amount_monthly_total"]
-    ) * 100
+        np.divide(
+            grouped_df["amount"].to_numpy(),
+            amount_monthly_total,
+            out=np.zeros(len(grouped_df)),
+            where=has_monthly_total,
+        )
+        * 100
+    )
 
     # Calculate the percentage of the main category's total amount
     grouped_df["main_category_percentage"] = (
-        grouped_df["main_category_sum"] / grouped_df["amount_monthly_total"] * 100
+        np.divide(
+            grouped_df["main_category_sum"].to_numpy(),
+            amount_monthly_total,
+            out=np.zeros(len(grouped_df)),
+            where=has_monthly_total,
+        )
+        * 100
     )
 
-    fig = px.bar(
-        grouped_df,
-        x="month_year",
-        y="percentage",
-        color="sub_category",
-        hover_data={
-            "amount": ":.2f",
-            "main_category_sum": ":.2f",
-            "main_category_percentage": ":.2f",
-            "main_category": True,
-            "percentage": ":.2f",
-            "month_year": False,
-        },
-        labels={"percentage": "Percentage Spent (%)", "month_year": "Month-Year"},
-        category_orders={"sub_category": grouped_df["sub_category"].unique()},
+    # The bars are built with go.Bar, like in _create_stacked_bar_chart, rather than with
+    # px.bar, which would copy and reshape grouped_df
+    fig = go.Figure()
+    for sub_category, sub_category_df in grouped_df.groupby(
+        "sub_category", observed=True
+    ):
+        fig.add_trace(
+            go.Bar(
+                x=sub_category_df["month_year"].tolist(),
+                y=sub_category_df["percentage"].to_numpy(),
+                name=sub_category,
+                legendgroup=sub_category,
+                marker_color=_get_sub_category_color(sub_category_df),
+                customdata=sub_category_df[
+                    [
+                        "amount",
+                        "main_category_sum",
+                        "main_category_percentage",
+                        "main_category",
+                    ]
+                ].to_numpy(),
+                hovertemplate=(
+                    f"sub_category={sub_category}<br>"
+                    "Percentage Spent (%)=%{y:.2f}<br>"
+                    "amount=%{customdata[0]:.2f}<br>"
+                    "main_category_sum=%{customdata[1]:.2f}<br>"
+                    "main_category_percentage=%{customdata[2]:.2f}<br>"
+                    "main_category=%{customdata[3]}<extra></extra>"
+                ),
+            )
+        )
+
+    fig.update_layout(
+        barmode="relative",
+        legend_title_text="sub_category",
+        xaxis_title="Month-Year",
+        yaxis_title="Percentage Spent (%)",
+        margin={"t": 60},
+    )
+    fig.update_xaxes(
+        type="category",
+        categoryorder="array",
+        categoryarray=grouped_df["month_year"].cat.categories.tolist(),
     )
 
-    # print(grouped_df.head(40))
     # # Customize hover template
     # fig.update_traces(
     #     hovertemplate=(
@@ -198,19 +279,6 @@ def _create_percent_stacked_bar_chart(grouped_df: pd.DataFrame) -> go.Figure:
     #     ].values,
     # )
 
-    # Update traces with custom colors
-    for main_category in grouped_df["main_category"].unique():
-        for trace in fig.data:
-            if (
-                trace.name
-                in grouped_df.loc[
-                    grouped_df["main_category"] == main_category, "sub_category"
-                ].values
-            ):
-                trace.marker.color = graph_utils.MAIN_FINANCE_CATEGORIES_COLOR_MAP[
-                    main_category
-                ]
-
     fig.update_layout(
         xaxis={"showgrid": False}, yaxis={"showgrid": True}, yaxis_tickformat="%"
     )
@@ -1,7 +1,7 @@
 import calendar
+import functools
 
 import pandas as pd
-import plotly.express as px
 import plotly.graph_objects as go
 
 CASH_FLOW_COLOR_MAP = {
@@ -41,79 +41,194 @@ MAIN_FINANCE_CATEGORIES_COLOR_MAP = {
 }
 
 
-def get_days_in_month(year: int, month: int) -> list[int]:
-    """Get a list of all the days in a given month.
+@functools.lru_cache(maxsize=256)
+def get_days_in_month(year: int, month: int) -> tuple[int, ...]:
+    """Get all the days in a given month.
 
     This function calculates the number of days in the specified month of the specified year
-    and returns a list of all the days in that month.
+    and returns all the days in that month. The results are cached, so they are returned as
+    a tuple, which cannot be modified by the callers sharing it.
 
     Args:
         year (int): The year as a four-digit number (e.g., 2024).
         month (int): The month as a number (1-12).
 
     Returns:
-        list[int]: A list of integers representing all the days in the specified month.
+        tuple[int, ...]: The integers representing all the days in the specified month.
     """
     num_days = calendar.monthrange(year, month)[1]
-    days_in_month = list(range(1, num_days + 1))
-    return days_in_month
+    return tuple(range(1, num_days + 1))
 
 
 def add_month_year_column(df: pd.DataFrame, date_column: str = "date") -> pd.DataFrame:
     """Adds a 'month_year' column to the DataFrame based on the specified date column.
 
     This function converts the specified date column to datetime format and creates a new
-    'month_year' column representing the year and month of each date.
+    'month_year' column representing the year and month of each date. The 'month_year'
+    column is categorical with its categories in chronological order, so only the unique
+    months are formatted as strings and filtering and grouping on it compares integer codes.
 
     Args:
         df (pd.DataFrame): The input DataFrame containing a date column.
         date_column (str): The name of the date column to be used for creating the 'month_year'
             column.
 
+    If the DataFrame already has a 'month_year' column (e.g. because it was added once to
+    the whole DataFrame before filtering it), only the months that no longer occur are
+    dropped from its categories, rather than converting the dates again.
+
     Returns:
         pd.DataFrame: A new DataFrame with the 'month_year' column added.
     """
-    df[date_column] = pd.to_datetime(df[date_column])
-    df["month_year"] = df[date_column].dt.to_period("M").astype(str)
-    return df
+    if "month_year" in df.columns:
+        return df.assign(month_year=df["month_year"].cat.remove_unused_categories())
+
+    dates = df[date_column]
+    if not pd.api.types.is_datetime64_any_dtype(dates):
+        # Notion dates are ISO 8601 strings, and many transactions share a date
+        dates = pd.to_datetime(dates, format="ISO8601", cache=True)
+    # Faster than formatting every date with dt.strftime("%Y-%m"), as the periods are
+    # integer-backed and only the unique months are formatted
+    month_year = dates.dt.to_period("M").astype("category")
+    # assign() leaves the input DataFrame untouched, so callers can pass a filtered view
+    # without copying it first
+    return df.assign(
+        **{
+            date_column: dates,
+            "month_year": month_year.cat.rename_categories(
+                month_year.cat.categories.astype(str)
+            ),
+        }
+    )
+
+
+def select_chart_data(
+    df: pd.DataFrame, mask: pd.Series, columns: list[str]
+) -> pd.DataFrame:
+    """Selects the rows of the DataFrame that a chart uses, with only the columns it uses.
+
+    The 'month_year' column is also selected if the DataFrame already has it (e.g. because
+    it was added once to the whole DataFrame), and is otherwise added from the 'date'
+    column (see `add_month_year_column`).
+
+    Args:
+        df (pd.DataFrame): The input DataFrame.
+        mask (pd.Series): A boolean mask of the rows of df to select.
+        columns (list[str]): The columns used by the chart, including 'date'.
+
+    Returns:
+        pd.DataFrame: A new DataFrame with the selected rows and columns, and a
+            'month_year' column.
+    """
+    selected_columns = [
+        column for column in [*columns, "month_year"] if column in df.columns
+    ]
+    return add_month_year_column(df.loc[mask, selected_columns])
+
+
+def get_monthly_totals(
+    df: pd.DataFrame, y_column: str = "amount", extra_x_group: str | None = None
+) -> pd.DataFrame:
+    """Sums a column of the DataFrame per month, and per subgroup within each month.
+
+    Args:
+        df (pd.DataFrame): A DataFrame containing at least 'month_year' and the specified y_column.
+            If extra_x_group is provided, the DataFrame should also contain that column.
+        y_column (str): The column name in df that contains the values to be summed.
+        extra_x_group (str | None): An optional column name for additional grouping within each
+            month_year.
+
+    Returns:
+        pd.DataFrame: A DataFrame with the 'month_year' (and extra_x_group) and y_column
+            columns, with one row per month (and subgroup), sorted by month.
+    """
+    group_columns = ["month_year", extra_x_group] if extra_x_group else "month_year"
+    # The groups are sorted (unlike the other groupbys of the graphs), as the order of the
+    # months determines the order of the x-axis, and the rows are not in date order
+    return df.groupby(group_columns, observed=True)[y_column].sum().reset_index()
 
 
-def plot_basic_monthly_bar_chart(df: pd.DataFrame, title: str) -> go.Figure:
-    """Plot a bar chart using Plotly Express.
+def plot_basic_monthly_bar_chart(
+    df: pd.DataFrame, title: str, monthly_totals: pd.DataFrame | None = None
+) -> go.Figure:
+    """Plot a grouped bar chart of monthly totals.
 
     This function generates a grouped bar chart showing the monthly totals of different
-    cash flow types from the input DataFrame. The chart is customized with hover data,
-    category orders, and a specified title.
+    cash flow types from the input DataFrame, with one bar per cash flow type and month.
+    The totals are aggregated in pandas, so the figure only contains one data point per bar
+    rather than one per row of the DataFrame.
 
     Args:
         df (pd.DataFrame): The DataFrame containing the data to be plotted, including columns for
-            [ 'name', 'date', 'amount', 'month_year', 'cash_flow_type']
+            ['amount', 'month_year', 'cash_flow_type']
         title (str): The title of the chart.
+        monthly_totals (pd.DataFrame | None): The monthly totals of 'amount' per
+            'cash_flow_type', as returned by `get_monthly_totals`, if already computed.
 
     Returns:
         go.Figure: The generated Plotly figure for the bar chart.
     """
-    fig = px.bar(
-        df,
-        x="month_year",
-        y="amount",
-        color="cash_flow_type",
-        color_discrete_map=CASH_FLOW_COLOR_MAP,
+    if monthly_totals is None:
+        monthly_totals = get_monthly_totals(df, "amount", "cash_flow_type")
+
+    fig = go.Figure()
+    # Add the cash flow types in the order they first appear, as Plotly Express would
+    for cash_flow_type in df["cash_flow_type"].unique():
+        cash_flow_type_totals = monthly_totals[
+            monthly_totals["cash_flow_type"] == cash_flow_type
+        ]
+        fig.add_trace(
+            go.Bar(
+                x=cash_flow_type_totals["month_year"].tolist(),
+                y=cash_flow_type_totals["amount"].to_numpy(),
+                name=cash_flow_type,
+                marker_color=CASH_FLOW_COLOR_MAP.get(cash_flow_type),
+                hovertemplate="%{x}<br>¥%{y:,.0f}",
+            )
+        )
+
+    fig.update_layout(
         title=title,
-        hover_data={
-            "name": True,
-            "date": True,
-            "amount": True,
-            "month_year": False,
-            "cash_flow_type": False,
-        },
-        category_orders={"month_year": sorted(df["month_year"].unique())},
         barmode="group",
+        legend_title_text="cash_flow_type",
+        xaxis_title="month_year",
+        yaxis_title="amount",
+        xaxis_tickangle=-45,
     )
+    fig.update_xaxes(
+        type="category",
+        categoryorder="array",
+        # The months are categories in chronological order (see add_month_year_column),
+        # which saves sorting the months of every row
+        categoryarray=monthly_totals["month_year"].cat.categories.tolist(),
+    )
+
+    return fig
+
+
+def plot_no_data_chart(title: str) -> go.Figure:
+    """Plot an empty chart with a "No data" message.
+
+    This is returned instead of building the bars and annotations of a chart when none of
+    the rows of the DataFrame match its filters.
 
-    fig.update_xaxes(type="category")
-    fig.update_layout(xaxis_tickangle=-45)
+    Args:
+        title (str): The title of the chart.
 
+    Returns:
+        go.Figure: The Plotly figure with only the title and the message.
+    """
+    fig = go.Figure()
+    fig.update_layout(title=title, xaxis={"visible": False}, yaxis={"visible": False})
+    fig.add_annotation(
+        text="No data",
+        xref="paper",
+        yref="paper",
+        x=0.5,
+        y=0.5,
+        showarrow=False,
+        font={"size": 16},
+    )
     return fig
 
 
@@ -132,7 +247,9 @@ def add_single_annotation(
     """Adds a single annotation on a Plotly figure.
 
     This function adds an annotation to the specified Plotly figure with customizable text and
-    other styling parameters.
+    other styling parameters. Each call updates the layout of the figure, so many annotations
+    are better added with a single `fig.update_layout(annotations=...)` (as in
+    `add_monthly_total_annotations`).
 
     Args:
         fig (go.Figure): The Plotly figure to which the annotation will be added.
@@ -164,11 +281,20 @@ def add_single_annotation(
     return fig
 
 
+# The style of the annotations of the monthly totals, shared by all of them
+_MONTHLY_TOTAL_ANNOTATION_STYLE = {
+    "showarrow": False,
+    "yshift": 10,  # Adjust position above the bar
+    "font": {"size": 12, "color": "black"},
+}
+
+
 def add_monthly_total_annotations(
     fig: go.Figure,
     df: pd.DataFrame,
     y_column: str = "amount",
     extra_x_group: str | None = None,
+    monthly_totals: pd.DataFrame | None = None,
 ) -> go.Figure:
     """
     Adds annotations for monthly totals to a Plotly figure.
@@ -183,15 +309,20 @@ def add_monthly_total_annotations(
         y_column (str): The column name in df that contains the values to be summed for annotations.
         extra_x_group (str | None): An optional column name for additional grouping within each
             month_year. If provided, annotations will be added for each subgroup within each month.
+        monthly_totals (pd.DataFrame | None): The monthly totals as returned by
+            `get_monthly_totals` for the same y_column and extra_x_group, if already
+            computed (e.g. for the bars of the chart).
 
     Returns:
         go.Figure: The Plotly figure with annotations added.
     """
-    if extra_x_group:
-        monthly_totals = (
-            df.groupby(["month_year", extra_x_group])[y_column].sum().reset_index()
-        )
+    if monthly_totals is None:
+        monthly_totals = get_monthly_totals(df, y_column, extra_x_group)
+
+    months = monthly_totals["month_year"].tolist()
+    totals = monthly_totals[y_column].tolist()
 
+    if extra_x_group:
         # Get unique cash flow types and their positions
         unique_x_groups = df[extra_x_group].unique()
         num_x_groups = len(unique_x_groups)
@@ -202,34 +333,34 @@ def add_monthly_total_annotations(
 
         group_positions = {x_group: i for i, x_group in enumerate(unique_x_groups)}
 
-        for _, row in monthly_totals.iterrows():
-            # Calculate the x offset based on the cash flow type position
-            # x_offset = (
-            #     group_positions[row[extra_x_group]] - (num_x_groups - 1) / 2
-            # ) * 0.7  # Adjust 0.7 as needed for spacing
-            x_offset = (
-                group_positions[row[extra_x_group]] - (num_x_groups - 1) / 2
-            ) * (bar_width + spacing)
-
-            fig.add_annotation(
-                x=row["month_year"],
-                y=row[y_column],
-                xshift=x_offset * 100,  # Convert to pixels for xshift
-                text=f"¥{row[y_column]:.0f}",  # Format the total sum as desired
-                showarrow=False,
-                yshift=10,  # Adjust position above the bar
-                font={"size": 12, "color": "black"},
-            )
+        # Calculate the x offset based on the cash flow type position
+        x_offsets = [
+            (group_positions[x_group] - (num_x_groups - 1) / 2) * (bar_width + spacing)
+            for x_group in monthly_totals[extra_x_group].tolist()
+        ]
+        annotations = [
+            {
+                "x": month,
+                "y": total,
+                "xshift": x_offset * 100,  # Convert to pixels for xshift
+                "text": f"¥{total:.0f}",  # Format the total sum as desired
+                **_MONTHLY_TOTAL_ANNOTATION_STYLE,
+            }
+            for month, total, x_offset in zip(months, totals, x_offsets)
+        ]
 
     else:
-        monthly_total = df.groupby("month_year")[y_column].sum().reset_index()
-        for _, row in monthly_total.iterrows():
-            fig.add_annotation(
-                x=row["month_year"],
-                y=row[y_column],
-                text=f"¥{row[y_column]:.0f}",  # Format the total sum as desired
-                showarrow=False,
-                yshift=10,  # Adjust position above the bar
-                font={"size": 12, "color": "black"},
-            )
+        annotations = [
+            {
+                "x": month,
+                "y": total,
+                "text": f"¥{total:.0f}",  # Format the total sum as desired
+                **_MONTHLY_TOTAL_ANNOTATION_STYLE,
+            }
+            for month, total in zip(months, totals)
+        ]
+
+    # Add all the annotations in a single layout update, rather than validating and
+    # appending them to the figure one at a time
+    fig.update_layout(annotations=[*fig.layout.annotations, *annotations])
     return fig
@@ -23,44 +23,38 @@ def timing_decorator(func: Callable[..., Any]) -> Callable[..., Any]:
         The wrapped function, which logs its execution time when called.
     """
 
-    @functools.wraps(func)
-    def sync_wrapper(*args: Any, **kwargs: Any) -> Any:
-        start_time = time.perf_counter()
-        result = func(*args, **kwargs)
-        end_time = time.perf_counter()
+    func_name = func.__name__
 
-        if args and hasattr(args[0], "__class__"):
-            class_name = args[0].__class__.__name__
+    def log_execution_time(args: tuple[Any, ...], start_time: int) -> None:
+        elapsed_seconds = (time.perf_counter_ns() - start_time) / 1e9
+        if args:
             _logger.info(
                 "%s.%s executed in %.4f seconds",
-                class_name,
-                func.__name__,
-                end_time - start_time,
+                type(args[0]).__name__,
+                func_name,
+                elapsed_seconds,
             )
         else:
-            _logger.info(
-                "%s executed in %.4f seconds", func.__name__, end_time - start_time
-            )
+            _logger.info("%s executed in %.4f seconds", func_name, elapsed_seconds)
+
+    @functools.wraps(func)
+    def sync_wrapper(*args: Any, **kwargs: Any) -> Any:
+        # Don't time the call when INFO is not logged (checked per call, as the level
+        # can be changed after decorating)
+        if not _logger.isEnabledFor(logging.INFO):
+            return func(*args, **kwargs)
+        start_time = time.perf_counter_ns()
+        result = func(*args, **kwargs)
+        log_execution_time(args, start_time)
         return result
 
     @functools.wraps(func)
     async def async_wrapper(*args: Any, **kwargs: Any) -> Coroutine:
-        start_time = time.perf_counter()
+        if not _logger.isEnabledFor(logging.INFO):
+            return await func(*args, **kwargs)
+        start_time = time.perf_counter_ns()
         result = await func(*args, **kwargs)
-        end_time = time.perf_counter()
-
-        if args and hasattr(args[0], "__class__"):
-            class_name = args[0].__class__.__name__
-            _logger.info(
-                "%s.%s executed in %.4f seconds",
-                class_name,
-                func.__name__,
-                end_time - start_time,
-            )
-        else:
-            _logger.info(
-                "%s executed in %.4f seconds", func.__name__, end_time - start_time
-            )
+        log_execution_time(args, start_time)
         return result
 
     if asyncio.iscoroutinefunction(func):
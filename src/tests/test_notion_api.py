@@ -0,0 +1,29 @@
+from types import SimpleNamespace
+
+import orjson
+
+from finance_tracker.connectors import notion_api
+
+
+def test_get_database_property_ids_are_url_decoded(monkeypatch):
+    urls = []
+
+    def get(url, timeout=None):  # pylint: disable=unused-argument
+        urls.append(url)
+        properties = {
+            "Name": {"id": "title"},
+            "Date": {"id": "%3AUPp"},
+            "Amount": {"id": "a%7Bb%5D"},
+        }
+        return SimpleNamespace(content=orjson.dumps({"properties": properties}))
+
+    monkeypatch.setattr(notion_api, "_get_session", lambda: SimpleNamespace(get=get))
+    notion_api.get_database_property_ids.cache_clear()
+
+    try:
+        property_ids = notion_api.get_database_property_ids("db")
+    finally:
+        notion_api.get_database_property_ids.cache_clear()
+
+    assert property_ids == {"Name": "title", "Date": ":UPp", "Amount": "a{b]"}
+    assert urls == ["https://api.notion.com/v1/databases/db"]
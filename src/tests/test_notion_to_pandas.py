@@ -0,0 +1,207 @@
+import orjson
+import pandas as pd
+import pytest
+
+from finance_tracker.connectors import notion_to_pandas
+from finance_tracker.graphs.utils import add_month_year_column
+
+PROPERTY_IDS = {"Name": "title", "Date": "a:b", "Amount": "cd"}
+
+
+def _page(page_id: str, last_edited_time: str, name: str = "") -> dict:
+    return {"id": page_id, "last_edited_time": last_edited_time, "name": name}
+
+
+class FakeNotion:
+    """Records the Notion API calls made by `get_finance_tracker_pages`."""
+
+    def __init__(self, last_edited_time, all_pages, edited_pages=None):
+        self.last_edited_time = last_edited_time
+        self.all_pages = all_pages
+        self.edited_pages = edited_pages or []
+        self.full_fetches = 0
+        self.since_queries = []
+
+    def get_database_in_partitions(self, database_id, property_ids):
+        assert database_id == "db"
+        assert property_ids == list(PROPERTY_IDS.values())
+        self.full_fetches += 1
+        return list(self.all_pages)
+
+    def get_database(self, database_id, property_ids=None, since=None):
+        assert database_id == "db"
+        assert property_ids == list(PROPERTY_IDS.values())
+        self.since_queries.append(since)
+        return list(self.edited_pages)
+
+
+@pytest.fixture(name="cache_path")
+def fixture_cache_path(tmp_path):
+    return str(tmp_path / "notion_cache_test.json")
+
+
+def _patch_notion(monkeypatch, cache_path, fake):
+    monkeypatch.setattr(
+        notion_to_pandas, "get_finance_tracker_database_id", lambda: "db"
+    )
+    monkeypatch.setattr(
+        notion_to_pandas, "_get_finance_tracker_cache_path", lambda: cache_path
+    )
+    monkeypatch.setattr(
+        notion_to_pandas, "get_last_edited_time", lambda _: fake.last_edited_time
+    )
+    monkeypatch.setattr(
+        notion_to_pandas, "get_database_property_ids", lambda _: PROPERTY_IDS
+    )
+    monkeypatch.setattr(
+        notion_to_pandas, "_get_database_in_partitions", fake.get_database_in_partitions
+    )
+    monkeypatch.setattr(notion_to_pandas, "get_database", fake.get_database)
+
+
+def _write_cache(cache_path, last_edited_time, pages):
+    with open(cache_path, "wb") as f:
+        f.write(
+            orjson.dumps(
+                {
+                    "last_edited_time": last_edited_time,
+                    "property_ids": list(PROPERTY_IDS.values()),
+                    "pages": pages,
+                }
+            )
+        )
+
+
+def _read_cache(cache_path):
+    with open(cache_path, "rb") as f:
+        return orjson.loads(f.read())
+
+
+def test_full_fetch_writes_cache(monkeypatch, cache_path):
+    pages = [_page("a", "2024-01-01T00:00:00.000Z")]
+    fake = FakeNotion("2024-01-01T00:00:00.000Z", pages)
+    _patch_notion(monkeypatch, cache_path, fake)
+
+    assert notion_to_pandas.get_finance_tracker_pages() == pages
+    assert fake.full_fetches == 1
+    assert _read_cache(cache_path)["pages"] == pages
+
+
+def test_cache_hit(monkeypatch, cache_path):
+    pages = [_page("a", "2024-01-01T00:00:00.000Z")]
+    _write_cache(cache_path, "2024-01-01T00:00:00.000Z", pages)
+    fake = FakeNotion("2024-01-01T00:00:00.000Z", [], edited_pages=pages)
+    _patch_notion(monkeypatch, cache_path, fake)
+
+    assert notion_to_pandas.get_finance_tracker_pages() == pages
+    assert fake.full_fetches == 0
+    assert fake.since_queries == ["2024-01-01T00:00:00.000Z"]
+
+
+def test_edit_in_same_minute_as_cache(monkeypatch, cache_path):
+    _write_cache(
+        cache_path,
+        "2024-01-01T00:00:00.000Z",
+        [_page("a", "2024-01-01T00:00:00.000Z", "old a")],
+    )
+    edited_pages = [_page("a", "2024-01-01T00:00:00.000Z", "new a")]
+    fake = FakeNotion("2024-01-01T00:00:00.000Z", [], edited_pages)
+    _patch_notion(monkeypatch, cache_path, fake)
+
+    assert notion_to_pandas.get_finance_tracker_pages() == edited_pages
+    assert fake.full_fetches == 0
+    assert _read_cache(cache_path)["pages"] == edited_pages
+
+
+def test_incremental_merge(monkeypatch, cache_path):
+    _write_cache(
+        cache_path,
+        "2024-01-01T00:00:00.000Z",
+        [
+            _page("a", "2024-01-01T00:00:00.000Z", "old a"),
+            _page("b", "2024-01-01T00:00:00.000Z", "old b"),
+        ],
+    )
+    edited_pages = [
+        _page("b", "2024-02-01T00:00:00.000Z", "new b"),
+        _page("c", "2024-02-01T00:00:00.000Z", "new c"),
+    ]
+    fake = FakeNotion("2024-02-01T00:00:00.000Z", [], edited_pages)
+    _patch_notion(monkeypatch, cache_path, fake)
+
+    pages = notion_to_pandas.get_finance_tracker_pages()
+
+    assert {page["id"]: page["name"] for page in pages} == {
+        "a": "old a",
+        "b": "new b",
+        "c": "new c",
+    }
+    assert fake.full_fetches == 0
+    assert fake.since_queries == ["2024-01-01T00:00:00.000Z"]
+    cache = _read_cache(cache_path)
+    assert cache["last_edited_time"] == "2024-02-01T00:00:00.000Z"
+    assert cache["pages"] == pages
+
+
+@pytest.mark.parametrize(
+    "content", [b'{"last_edited_time": "2024-01-01T00:0', b'{"pages": []}', b"[]"]
+)
+def test_unreadable_cache_falls_back_to_full_fetch(monkeypatch, cache_path, content):
+    with open(cache_path, "wb") as f:
+        f.write(content)
+    pages = [_page("a", "2024-01-01T00:00:00.000Z")]
+    fake = FakeNotion("2024-01-01T00:00:00.000Z", pages)
+    _patch_notion(monkeypatch, cache_path, fake)
+
+    assert notion_to_pandas.get_finance_tracker_pages() == pages
+    assert fake.full_fetches == 1
+    assert _read_cache(cache_path)["pages"] == pages
+
+
+def test_get_database_in_partitions(monkeypatch):
+    query_filters = []
+
+    def get_database(database_id, property_ids=None, query_filter=None):
+        assert database_id == "db"
+        assert property_ids == ["a:b"]
+        query_filters.append(query_filter)
+        return [_page(f"page {len(query_filters)}", "2024-01-01T00:00:00.000Z")]
+
+    monkeypatch.setattr(notion_to_pandas, "get_database", get_database)
+
+    pages = notion_to_pandas._get_database_in_partitions(  # pylint: disable=protected-access
+        "db", property_ids=["a:b"]
+    )
+
+    # Every partition is fetched once, and the pages of all partitions are returned
+    assert len(query_filters) == 3
+    assert all(query_filter is not None for query_filter in query_filters)
+    assert sorted(page["id"] for page in pages) == ["page 1", "page 2", "page 3"]
+
+
+def test_cache_write_leaves_no_temporary_files(tmp_path, cache_path):
+    notion_to_pandas._write_finance_tracker_cache(  # pylint: disable=protected-access
+        cache_path, None, [], []
+    )
+    assert [path.name for path in tmp_path.iterdir()] == ["notion_cache_test.json"]
+
+
+def test_parse_notion_dates_keeps_wall_clock_of_mixed_offsets():
+    dates = notion_to_pandas._parse_notion_dates(  # pylint: disable=protected-access
+        (
+            "2024-01-01",
+            "2024-01-31T23:30:00.000+09:00",
+            "2024-02-01T00:30:00.000-05:00",
+            "2024-03-01T10:00:00.000Z",
+        )
+    )
+
+    assert dates.dt.tz is None
+    assert dates.tolist() == [
+        pd.Timestamp("2024-01-01 00:00"),
+        pd.Timestamp("2024-01-31 23:30"),
+        pd.Timestamp("2024-02-01 00:30"),
+        pd.Timestamp("2024-03-01 10:00"),
+    ]
+    month_year = add_month_year_column(pd.DataFrame({"date": dates}))["month_year"]
+    assert month_year.tolist() == ["2024-01", "2024-01", "2024-02", "2024-03"]